@@ -1,26 +1,26 @@
 import cv2
 import numpy as np
 import os
-import pickle
 
-def classify_contour(cnt, img_shape):
+# Make sure OpenCV uses its SIMD code paths and all cores
+cv2.setUseOptimized(True)
+cv2.setNumThreads(os.cpu_count() or 1)
+
+def classify_contour(area, peri, bbox, hull_area, img_shape):
     """
-    Improved contour classification with better wall detection
+    Improved contour classification with better wall detection.
+    Takes precomputed geometry so it only does arithmetic.
     """
-    area = cv2.contourArea(cnt)
-    x, y, w, h = cv2.boundingRect(cnt)
+    x, y, w, h = bbox
     aspect = w / float(h + 1e-9)
-    perimeter = cv2.arcLength(cnt, True)
     
     # Compactness (circularity) measure
-    if perimeter > 0:
-        circularity = 4 * np.pi * area / (perimeter * perimeter)
+    if peri > 0:
+        circularity = 4 * np.pi * area / (peri * peri)
     else:
         circularity = 0
 
     # Calculate solidity (area / convex hull area)
-    hull = cv2.convexHull(cnt)
-    hull_area = cv2.contourArea(hull)
     if hull_area > 0:
         solidity = area / hull_area
     else:
@@ -61,15 +61,17 @@ def classify_contour(cnt, img_shape):
 
     return None
 
-def detect_rooms(edges):
+def detect_rooms(closed_edges):
     """
-    Detect rooms by finding enclosed spaces in the floor plan
+    Detect rooms by finding enclosed spaces in the floor plan.
+    Expects edges already closed with a 3x3 kernel (see get_contours).
+    Returns room outlines already simplified with approxPolyDP.
     """
     # Create a kernel for morphological operations
     kernel = np.ones((5, 5), np.uint8)
     
-    # Close small gaps in walls
-    closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel, iterations=2)
+    # Close the remaining gaps in walls on top of the 3x3 close
+    closed = cv2.morphologyEx(cv2.UMat(closed_edges), cv2.MORPH_CLOSE, kernel, iterations=1).get()
     
     # Find all contours
     contours, _ = cv2.findContours(closed, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
@@ -84,27 +86,90 @@ def detect_rooms(edges):
             if perimeter > 0:
                 circularity = 4 * np.pi * area / (perimeter * perimeter)
                 if circularity > 0.15:  # Reasonably shaped room
-                    room_contours.append(cnt)
+                    # Simplify using the perimeter computed above
+                    approx = cv2.approxPolyDP(cnt, 0.02 * perimeter, True)
+                    room_contours.append(approx)
                     print(f"Room detected: area={area:.1f}, circularity={circularity:.3f}")
     
     return room_contours
 
-def get_contours(edges_path="../output/edges.png", out_pickle="../output/contours.pkl", out_vis="../output/contours.png"):
+def save_contours(path, contours_dict):
+    """
+    Save contours as one contiguous float32 (N, 2) array per label plus
+    offsets marking where each contour starts and ends, and a
+    (min_x, min_y, width, height) bounding box per contour
+    """
+    arrays = {}
+    for label, clist in contours_dict.items():
+        xy_list = [np.asarray(c, dtype=np.float32).reshape(-1, 2) for c in clist]
+        off = np.cumsum([0] + [len(a) for a in xy_list])
+        if xy_list:
+            xy = np.concatenate(xy_list)
+            mins = np.minimum.reduceat(xy, off[:-1], axis=0)
+            maxs = np.maximum.reduceat(xy, off[:-1], axis=0)
+            bbox = np.hstack([mins, maxs - mins])
+        else:
+            xy = np.empty((0, 2), np.float32)
+            bbox = np.empty((0, 4), np.float32)
+        arrays[f"{label}_xy"] = xy
+        arrays[f"{label}_off"] = off
+        arrays[f"{label}_bbox"] = bbox
+    np.savez(path, **arrays)
+
+def load_contours(path):
+    """
+    Load contours saved by save_contours as {label: [(N, 2) array, ...]}
+    together with {label: (K, 4) bounding box array}
+    """
+    contours_dict = {}
+    bboxes = {}
+    with np.load(path) as data:
+        for key in data.files:
+            if not key.endswith("_xy"):
+                continue
+            label = key[:-len("_xy")]
+            xy = data[key]
+            off = data[f"{label}_off"]
+            contours_dict[label] = [xy[s:e] for s, e in zip(off[:-1], off[1:])]
+            bboxes[label] = data[f"{label}_bbox"]
+    return contours_dict, bboxes
+
+def load_edges(edges_path):
+    """
+    Load an edge mask, preferring the raw .npy that preprocess.py writes
+    next to the PNG over decoding the PNG itself. The .npy is memory-mapped
+    read-only, so its pages are shared rather than copied.
+    The .npy exists as soon as preprocess_image returns, before the PNG
+    has been written in the background. Returns None if neither exists.
+    """
+    npy_path = os.path.splitext(edges_path)[0] + ".npy"
+    if os.path.exists(npy_path):
+        return np.load(npy_path, mmap_mode="r")
     if not os.path.exists(edges_path):
-        print("❌ edges.png not found. Run preprocess.py first.")
-        return {}
+        return None
+    return cv2.imread(edges_path, cv2.IMREAD_GRAYSCALE)
 
-    edges = cv2.imread(edges_path, cv2.IMREAD_GRAYSCALE)
+def get_contours(edges_path="../output/edges.png", out_npz="../output/contours.npz", out_vis="../output/contours.png"):
+    edges = load_edges(edges_path)
     if edges is None:
-        print("❌ Failed to read edges image.")
+        print("❌ Edges not found or unreadable. Run preprocess.py first.")
         return {}
 
     # Create a cleaned version of edges for better contour detection
     kernel = np.ones((3, 3), np.uint8)
-    cleaned_edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel, iterations=1)
+    closed_edges = cv2.morphologyEx(cv2.UMat(edges), cv2.MORPH_CLOSE, kernel, iterations=1).get()
+
+    # Drop tiny edge fragments in one pass before contour extraction.
+    # A contour never encloses more than its component's bounding box, so
+    # this only removes components the contourArea < 200 check would skip.
+    n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(closed_edges, connectivity=8)
+    keep = stats[:, cv2.CC_STAT_WIDTH] * stats[:, cv2.CC_STAT_HEIGHT] >= 200
+    keep[0] = False  # Label 0 is the background
+    cleaned_edges = keep[labels].astype(np.uint8) * 255
+    print(f"Kept {int(keep.sum())} of {n_labels - 1} edge components")
     
-    # Find contours with hierarchy
-    contours, hierarchy = cv2.findContours(cleaned_edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    # Find contours (hierarchy is never used, so skip building the tree)
+    contours, _ = cv2.findContours(cleaned_edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
     print(f"Total raw contours found: {len(contours)}")
 
     # Filter and classify contours
@@ -117,24 +182,26 @@ def get_contours(edges_path="../output/edges.png", out_pickle="../output/contour
             continue
 
         # Simplify contour
-        epsilon = 0.01 * cv2.arcLength(cnt, True)
+        peri = cv2.arcLength(cnt, True)
+        epsilon = 0.01 * peri
         approx = cv2.approxPolyDP(cnt, epsilon, True)
         
         # Skip contours with too few points
         if len(approx) < 3:
             continue
 
-        label = classify_contour(approx, edges.shape)
+        # Compute remaining geometry once and pass it to the classifier
+        bbox = cv2.boundingRect(approx)
+        hull_area = cv2.contourArea(cv2.convexHull(approx))
+        label = classify_contour(area, peri, bbox, hull_area, edges.shape)
         if label:
-            contours_dict[label].append(approx.tolist())
+            contours_dict[label].append(approx.reshape(-1, 2).astype(np.float32))
             print(f"Contour {i}: area={area:.1f}, classified as {label}")
 
     # Detect rooms separately
-    room_contours = detect_rooms(edges)
-    for room_cnt in room_contours:
-        epsilon = 0.02 * cv2.arcLength(room_cnt, True)
-        approx = cv2.approxPolyDP(room_cnt, epsilon, True)
-        contours_dict["rooms"].append(approx.tolist())
+    room_contours = detect_rooms(closed_edges)
+    for approx in room_contours:
+        contours_dict["rooms"].append(approx.reshape(-1, 2).astype(np.float32))
 
     # Visualization
     vis = np.ones((edges.shape[0], edges.shape[1], 3), dtype=np.uint8) * 255
@@ -146,23 +213,27 @@ def get_contours(edges_path="../output/edges.png", out_pickle="../output/contour
     }
     
     for label, clist in contours_dict.items():
-        for c in clist:
-            pts = np.array(c, dtype=np.int32).reshape(-1, 1, 2)
-            if label == "rooms":
-                # Fill rooms with semi-transparent green
-                overlay = vis.copy()
+        if not clist:
+            continue
+        pts_list = [np.asarray(c, dtype=np.int32).reshape(-1, 1, 2) for c in clist]
+        if label == "rooms":
+            # Fill rooms with semi-transparent green
+            overlay = vis.copy()
+            for pts in pts_list:
                 cv2.fillPoly(overlay, [pts], colors[label])
-                cv2.addWeighted(overlay, 0.3, vis, 0.7, 0, vis)
-                cv2.drawContours(vis, [pts], -1, colors[label], 2)
-            else:
-                cv2.drawContours(vis, [pts], -1, colors[label], 2)
+            cv2.addWeighted(overlay, 0.3, vis, 0.7, 0, vis)
+            cv2.drawContours(vis, pts_list, -1, colors[label], 2)
+        else:
+            cv2.drawContours(vis, pts_list, -1, colors[label], 2)
+            # Fill one polygon per call: a multi-polygon fill is even-odd and
+            # would leave the inside of wall rings unfilled
+            for pts in pts_list:
                 cv2.fillPoly(vis, [pts], colors[label])
 
-    os.makedirs(os.path.dirname(out_pickle), exist_ok=True)
+    os.makedirs(os.path.dirname(out_npz), exist_ok=True)
     cv2.imwrite(out_vis, vis)
     
-    with open(out_pickle, "wb") as f:
-        pickle.dump(contours_dict, f)
+    save_contours(out_npz, contours_dict)
 
     print(f"✅ Saved contours: {len(contours_dict['walls'])} walls, "
           f"{len(contours_dict['doors'])} doors, "
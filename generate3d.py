@@ -1,13 +1,14 @@
 import cv2
 import numpy as np
 import os
-import pickle
-from shapely.geometry import Polygon, MultiPolygon, LineString
+from shapely.geometry import Polygon, MultiPolygon
 from shapely.ops import unary_union, polygonize
+from shapely import affinity
 import trimesh
 import json
 import random
-from sklearn.cluster import DBSCAN
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contours import load_contours, load_edges
 
 # Parameters
 SCALE_PX_TO_M = 0.05
@@ -18,8 +19,11 @@ WINDOW_BASE = 1.0
 FLOOR_THICKNESS = 0.1
 CEILING_THICKNESS = 0.1
 WALL_THICKNESS = 0.15  # Added wall thickness parameter
+WALL_ANGLE_BINS = 18  # Orientation bins over [0, pi) for line clustering
+WALL_OFFSET_BIN_PX = 10  # Perpendicular offset bin size for line clustering
+PARALLEL_MIN_MESHES = 64  # Rough guess (not measured) at where pool startup pays off
 
-INPUT_PK = "../output/contours.pkl"
+INPUT_NPZ = "../output/contours.npz"
 OUT_DIR = "../output"
 FURNITURE_DIR = "../furniture"  # Directory for furniture models
 
@@ -35,6 +39,18 @@ FURNITURE_TYPES = {
     "tv_stand": {"size": (1.8, 0.4, 0.5), "color": [139, 69, 19, 255]},
 }
 
+# One template box per furniture type, copied for each placement
+_FURNITURE_TEMPLATES = {name: trimesh.creation.box(spec["size"])
+                        for name, spec in FURNITURE_TYPES.items()}
+
+# Rotation matrices about Z for the furniture angles used in auto_furnish_room
+_FURNITURE_ROTATIONS = {angle: trimesh.transformations.rotation_matrix(angle, [0, 0, 1])
+                        for angle in (0, np.pi/2, np.pi)}
+
+def to_meters(pts):
+    """Convert pixel points of any (..., 2) layout to an (N, 2) array in meters"""
+    return np.asarray(pts, dtype=np.float64).reshape(-1, 2) * SCALE_PX_TO_M
+
 def detect_walls_from_lines(edges):
     """
     Improved wall detection using line detection and clustering
@@ -44,128 +60,93 @@ def detect_walls_from_lines(edges):
     
     if lines is None:
         return []
+    lines = lines.reshape(-1, 4).astype(np.float64)
     
-    # Convert lines to Shapely LineStrings
-    line_strings = []
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        line_strings.append(LineString([(x1, y1), (x2, y2)]))
-    
-    # Cluster lines by angle and proximity
-    angles = []
-    centers = []
-    for line in line_strings:
-        # Calculate angle
-        dx = line.coords[1][0] - line.coords[0][0]
-        dy = line.coords[1][1] - line.coords[0][1]
-        angle = np.arctan2(dy, dx) % np.pi  # Normalize to 0-pi
-        angles.append(angle)
-        
-        # Calculate center
-        center_x = (line.coords[0][0] + line.coords[1][0]) / 2
-        center_y = (line.coords[0][1] + line.coords[1][1]) / 2
-        centers.append([center_x, center_y])
+    # Cluster lines by orientation bin and perpendicular offset
+    dx = lines[:, 2] - lines[:, 0]
+    dy = lines[:, 3] - lines[:, 1]
+    angles = np.arctan2(dy, dx) % np.pi  # Normalize to 0-pi
+    bin_width = np.pi / WALL_ANGLE_BINS
+    angle_bins = np.floor(angles / bin_width + 0.5).astype(np.int64) % WALL_ANGLE_BINS
     
-    # Cluster lines
-    X = np.column_stack([angles, centers])
-    clustering = DBSCAN(eps=0.2, min_samples=2).fit(X)
+    # Measure offsets against the bin centre so lines near 0 and pi agree
+    theta = angle_bins * bin_width
+    center_x = (lines[:, 0] + lines[:, 2]) / 2
+    center_y = (lines[:, 1] + lines[:, 3]) / 2
+    offsets = -center_x * np.sin(theta) + center_y * np.cos(theta)
+    offset_bins = np.floor(offsets / WALL_OFFSET_BIN_PX).astype(np.int64)
+    offset_bins -= offset_bins.min()
     
-    # Group lines by cluster
-    clusters = {}
-    for i, label in enumerate(clustering.labels_):
-        if label not in clusters:
-            clusters[label] = []
-        clusters[label].append(line_strings[i])
+    keys = angle_bins * (offset_bins.max() + 1) + offset_bins
+    _, labels, counts = np.unique(keys, return_inverse=True, return_counts=True)
     
-    # Merge lines in each cluster and create wall polygons
-    wall_polygons = []
-    for label, lines in clusters.items():
-        if label == -1:  # Skip noise
+    # Merge overlapping lines in each cluster and rasterize them
+    wall_mask = np.zeros(edges.shape, dtype=np.uint8)
+    order = np.argsort(labels, kind="stable")
+    for idx in np.split(order, np.cumsum(counts)[:-1]):
+        if len(idx) < 2:  # Skip noise
             continue
-            
-        # Merge lines
-        merged_line = unary_union(lines)
         
-        # Buffer to create thickness
-        if merged_line.geom_type == 'LineString':
-            wall_poly = merged_line.buffer(WALL_THICKNESS / SCALE_PX_TO_M, cap_style=2)
-            wall_polygons.append(wall_poly)
-        elif merged_line.geom_type == 'MultiLineString':
-            for line in merged_line.geoms:
-                wall_poly = line.buffer(WALL_THICKNESS / SCALE_PX_TO_M, cap_style=2)
-                wall_polygons.append(wall_poly)
-    
-    return wall_polygons
-
-def classify_contour(cnt, img_shape):
-    """
-    Improved contour classification with better heuristics
-    """
-    area = cv2.contourArea(cnt)
-    x, y, w, h = cv2.boundingRect(cnt)
-    aspect = w / float(h + 1e-9)
-    perimeter = cv2.arcLength(cnt, True)
-    
-    # Compactness (circularity) measure
-    if perimeter > 0:
-        circularity = 4 * np.pi * area / (perimeter * perimeter)
-    else:
-        circularity = 0
-
-    # Calculate solidity (area / convex hull area)
-    hull = cv2.convexHull(cnt)
-    hull_area = cv2.contourArea(hull)
-    if hull_area > 0:
-        solidity = area / hull_area
-    else:
-        solidity = 0
-
-    # Walls: large areas, typically rectangular, near image boundaries
-    # Check if contour touches image boundaries (common for walls)
-    touches_boundary = (x == 0 or y == 0 or 
-                        x + w >= img_shape[1] - 1 or 
-                        y + h >= img_shape[0] - 1)
-    
-    # Wall detection criteria
-    is_wall = (area > 3000 and 0.2 < aspect < 5.0 and 
-               circularity < 0.4 and solidity > 0.7)
+        # Bins only group the lines; draw along the cluster's own mean
+        # direction (averaged on doubled angles so 0 and pi agree) and offset
+        phi = 0.5 * np.arctan2(np.sin(2 * angles[idx]).mean(),
+                               np.cos(2 * angles[idx]).mean())
+        c, s = np.cos(phi), np.sin(phi)
+        x0, y0, x1, y1 = lines[idx].T
+        rho = (-(x0 + x1) * s + (y0 + y1) * c).mean() / 2
+        t0 = x0 * c + y0 * s
+        t1 = x1 * c + y1 * s
+        starts = np.minimum(t0, t1)
+        ends = np.maximum(t0, t1)
+        
+        # Merge overlapping 1D intervals along the wall direction
+        run_order = np.argsort(starts)
+        seg_start = starts[run_order]
+        seg_end = np.maximum.accumulate(ends[run_order])
+        breaks = np.flatnonzero(seg_start[1:] > seg_end[:-1]) + 1
+        for run_start, run_end in zip(np.r_[0, breaks], np.r_[breaks, len(idx)]):
+            ta, tb = seg_start[run_start], seg_end[run_end - 1]
+            p1 = (int(round(ta * c - rho * s)), int(round(ta * s + rho * c)))
+            p2 = (int(round(tb * c - rho * s)), int(round(tb * s + rho * c)))
+            cv2.line(wall_mask, p1, p2, 255, 1)
     
-    # Doors: medium size, rectangular
-    is_door = (500 < area <= 3000 and 0.4 < aspect < 2.5 and 
-               circularity < 0.5)
-    
-    # Windows: thin, elongated rectangles
-    is_window = (200 < area <= 2000 and (aspect >= 2.5 or aspect <= 0.4) and
-                 circularity < 0.6)
-
-    # Prioritize walls that touch boundaries
-    if is_wall and touches_boundary:
-        return "walls"
-    elif is_wall and not touches_boundary:
-        # Could be interior walls or large furniture
-        # Check if it's likely a wall by its shape
-        if solidity > 0.8 and circularity < 0.3:
-            return "walls"
+    # Dilate to create thickness and trace the wall outlines
+    radius = max(1, int(round(WALL_THICKNESS / SCALE_PX_TO_M)))
+    kernel = np.ones((2 * radius + 1, 2 * radius + 1), np.uint8)
+    wall_mask = cv2.dilate(wall_mask, kernel)
+    outlines, hierarchy = cv2.findContours(wall_mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+    hierarchy = hierarchy.reshape(-1, 4)
     
-    if is_door:
-        return "doors"
+    # Top-level outlines are wall shells; their children are enclosed spaces
+    wall_polygons = []
+    for i, outline in enumerate(outlines):
+        if hierarchy[i, 3] != -1 or len(outline) < 3:
+            continue
+        holes = []
+        child = hierarchy[i, 2]
+        while child != -1:
+            if len(outlines[child]) >= 3:
+                holes.append(outlines[child].reshape(-1, 2))
+            child = hierarchy[child, 0]
+        wall_polygons.append(Polygon(outline.reshape(-1, 2), holes))
     
-    if is_window:
-        return "windows"
-
-    return None
+    return wall_polygons
 
 def detect_rooms(wall_polygons, edges):
     """
     Detect rooms by finding enclosed spaces between walls
     """
+    # Union the walls once and reuse it for the bounds and the difference
+    walls_union = unary_union(wall_polygons)
+    
     # Create a polygon of the entire space
-    bounds = unary_union(wall_polygons).bounds
-    min_x, min_y, max_x, max_y = bounds
+    min_x, min_y, max_x, max_y = walls_union.bounds
     entire_space = Polygon([(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)])
     
     # Subtract walls from the entire space
-    free_space = entire_space.difference(unary_union(wall_polygons))
+    free_space = entire_space.difference(walls_union)
     
     # Find connected components (rooms)
     if free_space.geom_type == 'Polygon':
@@ -185,14 +166,12 @@ def detect_rooms(wall_polygons, edges):
 def create_wall_mesh_from_polygon(polygon, height):
     """Create a wall mesh from a polygon using trimesh"""
     try:
-        # Extract exterior coordinates
+        # Create 2D polygon, keeping any holes (enclosed rooms)
         if hasattr(polygon, 'exterior'):
-            points = list(polygon.exterior.coords)
+            polygon_2d = Polygon(polygon.exterior.coords,
+                                 [hole.coords for hole in polygon.interiors])
         else:
-            points = polygon
-            
-        # Create 2D polygon
-        polygon_2d = Polygon(points)
+            polygon_2d = Polygon(polygon)
         if not polygon_2d.is_valid:
             polygon_2d = polygon_2d.buffer(0)  # Try to fix invalid polygon
             
@@ -204,6 +183,20 @@ def create_wall_mesh_from_polygon(polygon, height):
         print(f"Error creating wall mesh: {e}")
         return None
 
+def _wall_worker(outline):
+    """Process pool entry point for extruding one wall outline"""
+    return create_wall_mesh_from_polygon(outline, WALL_HEIGHT)
+
+def map_meshes(worker, inputs):
+    """Apply worker to each input, using a process pool for large batches"""
+    workers = os.cpu_count() or 1
+    if workers < 2 or len(inputs) < PARALLEL_MIN_MESHES:
+        return [worker(x) for x in inputs]
+    
+    chunksize = max(1, len(inputs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(worker, inputs, chunksize=chunksize))
+
 def create_wall_mesh_from_line(line, height, thickness):
     """Create a wall mesh from a line with thickness"""
     try:
@@ -229,8 +222,8 @@ def create_wall_mesh_from_line(line, height, thickness):
         print(f"Error creating wall mesh from line: {e}")
         return None
 
-def create_floor_mesh(polygon, thickness=0.1, height=0):
-    """Create a floor mesh"""
+def create_floor_and_ceiling_meshes(polygon, floor_thickness=0.1, ceiling_thickness=0.1, ceiling_height=3.0):
+    """Create floor and ceiling meshes sharing a single triangulation"""
     try:
         if hasattr(polygon, 'exterior'):
             points = list(polygon.exterior.coords)
@@ -242,28 +235,21 @@ def create_floor_mesh(polygon, thickness=0.1, height=0):
         if not polygon_2d.is_valid:
             polygon_2d = polygon_2d.buffer(0)
             
-        # Extrude to create a thin floor
-        mesh = trimesh.creation.extrude_polygon(polygon_2d, height=thickness)
-        mesh.apply_translation([0, 0, height])
-        return mesh
+        # Triangulate once and extrude both thin slabs from the same faces
+        vertices, faces = trimesh.creation.triangulate_polygon(polygon_2d)
+        floor = trimesh.creation.extrude_triangulation(vertices, faces, height=floor_thickness)
+        ceiling = trimesh.creation.extrude_triangulation(vertices, faces, height=ceiling_thickness)
+        ceiling.apply_translation([0, 0, ceiling_height])
+        return floor, ceiling
         
     except Exception as e:
         print(f"Error creating floor mesh: {e}")
-        return None
+        return None, None
 
-def create_door_mesh(points, height):
-    """Create a door mesh from bounding box"""
+def create_door_mesh(bbox, height):
+    """Create a door mesh from a (min_x, min_y, width, depth) bounding box"""
     try:
-        if len(points) < 3:
-            return None
-            
-        # Get bounding box
-        points_array = np.array(points)
-        min_x, min_y = np.min(points_array, axis=0)
-        max_x, max_y = np.max(points_array, axis=0)
-        
-        width = max_x - min_x
-        depth = max_y - min_y
+        min_x, min_y, width, depth = bbox
         
         # Create box mesh
         mesh = trimesh.creation.box([width, depth, height])
@@ -277,19 +263,10 @@ def create_door_mesh(points, height):
         print(f"Error creating door mesh: {e}")
         return None
 
-def create_window_mesh(points, height, base_height):
-    """Create a window mesh from bounding box"""
+def create_window_mesh(bbox, height, base_height):
+    """Create a window mesh from a (min_x, min_y, width, depth) bounding box"""
     try:
-        if len(points) < 3:
-            return None
-            
-        # Get bounding box
-        points_array = np.array(points)
-        min_x, min_y = np.min(points_array, axis=0)
-        max_x, max_y = np.max(points_array, axis=0)
-        
-        width = max_x - min_x
-        depth = max_y - min_y
+        min_x, min_y, width, depth = bbox
         
         # Create box mesh
         mesh = trimesh.creation.box([width, depth, height])
@@ -312,15 +289,18 @@ def create_furniture_mesh(furniture_type, position, rotation=0):
         size = FURNITURE_TYPES[furniture_type]["size"]
         color = FURNITURE_TYPES[furniture_type]["color"]
         
-        # Create box mesh
-        mesh = trimesh.creation.box(size)
+        # Copy the template box mesh
+        mesh = _FURNITURE_TEMPLATES[furniture_type].copy()
         
         # Apply color
         mesh.visual.face_colors = color
         
         # Position and rotate
         mesh.apply_translation([position[0], position[1], size[2]/2])
-        mesh.apply_transform(trimesh.transformations.rotation_matrix(rotation, [0, 0, 1]))
+        rotation_matrix = _FURNITURE_ROTATIONS.get(rotation)
+        if rotation_matrix is None:
+            rotation_matrix = trimesh.transformations.rotation_matrix(rotation, [0, 0, 1])
+        mesh.apply_transform(rotation_matrix)
         
         return mesh
         
@@ -328,6 +308,25 @@ def create_furniture_mesh(furniture_type, position, rotation=0):
         print(f"Error creating {furniture_type} mesh: {e}")
         return None
 
+def concatenate_meshes(meshes):
+    """Combine meshes into one by filling preallocated vertex/face/color buffers"""
+    n_vertices = sum(len(m.vertices) for m in meshes)
+    n_faces = sum(len(m.faces) for m in meshes)
+    vertices = np.empty((n_vertices, 3), dtype=np.float64)
+    faces = np.empty((n_faces, 3), dtype=np.int64)
+    colors = np.empty((n_faces, 4), dtype=np.uint8)
+    
+    vo = fo = 0
+    for m in meshes:
+        nv, nf = len(m.vertices), len(m.faces)
+        vertices[vo:vo + nv] = m.vertices
+        faces[fo:fo + nf] = m.faces + vo
+        colors[fo:fo + nf] = m.visual.face_colors
+        vo += nv
+        fo += nf
+    
+    return trimesh.Trimesh(vertices=vertices, faces=faces, face_colors=colors, process=False)
+
 def auto_furnish_room(room_polygon, room_type="living"):
     """Automatically add furniture to a room based on its type"""
     furniture_meshes = []
@@ -401,12 +400,11 @@ def auto_furnish_room(room_polygon, room_type="living"):
     return furniture_meshes
 
 def main():
-    if not os.path.exists(INPUT_PK):
-        print("❌ contours.pkl not found. Run contours.py first.")
+    if not os.path.exists(INPUT_NPZ):
+        print("❌ contours.npz not found. Run contours.py first.")
         return
 
-    with open(INPUT_PK, "rb") as f:
-        contours = pickle.load(f)
+    contours, bboxes = load_contours(INPUT_NPZ)
 
     print(f"Loaded contours: {len(contours.get('walls', []))} walls, "
           f"{len(contours.get('doors', []))} doors, "
@@ -414,59 +412,43 @@ def main():
           f"{len(contours.get('rooms', []))} rooms")
 
     # Load edges image for line-based wall detection
-    edges_path = "../output/edges.png"
-    if os.path.exists(edges_path):
-        edges = cv2.imread(edges_path, cv2.IMREAD_GRAYSCALE)
+    edges = load_edges("../output/edges.png")
+    if edges is not None:
         wall_polygons = detect_walls_from_lines(edges)
         print(f"Detected {len(wall_polygons)} walls from lines")
     else:
         wall_polygons = []
         print("Edges image not found, using contour-based walls only")
 
-    # Process walls from contours
-    wall_meshes = []
+    # Collect wall outlines from contours and line detection, in meters
+    wall_jobs = []
     for i, wall in enumerate(contours.get("walls", [])):
-        try:
-            # Convert points to meters
-            points = [(p[0][0] * SCALE_PX_TO_M, p[0][1] * SCALE_PX_TO_M) for p in wall]
-            
-            if len(points) >= 3:
-                mesh = create_wall_mesh_from_polygon(points, WALL_HEIGHT)
-                if mesh:
-                    # Set wall color (light gray)
-                    mesh.visual.face_colors = [200, 200, 200, 255]
-                    wall_meshes.append(mesh)
-                    print(f"Created wall mesh {i+1}")
-                else:
-                    print(f"Failed to create wall mesh {i+1}")
-        except Exception as e:
-            print(f"Error processing wall {i+1}: {e}")
-
-    # Process walls from line detection
+        if len(wall) >= 3:
+            wall_jobs.append((f"wall mesh {i+1}", to_meters(wall)))
     for i, wall_poly in enumerate(wall_polygons):
-        try:
-            # Convert polygon points to meters
-            points = [(p[0] * SCALE_PX_TO_M, p[1] * SCALE_PX_TO_M) for p in wall_poly.exterior.coords]
-            
-            if len(points) >= 3:
-                mesh = create_wall_mesh_from_polygon(points, WALL_HEIGHT)
-                if mesh:
-                    # Set wall color (light gray)
-                    mesh.visual.face_colors = [200, 200, 200, 255]
-                    wall_meshes.append(mesh)
-                    print(f"Created wall mesh from line {i+1}")
-        except Exception as e:
-            print(f"Error processing wall from line {i+1}: {e}")
+        # Scale the whole polygon so enclosed spaces stay as holes
+        wall_jobs.append((f"wall mesh from line {i+1}",
+                          affinity.scale(wall_poly, SCALE_PX_TO_M, SCALE_PX_TO_M, origin=(0, 0))))
+
+    # Extrude walls, in parallel when there are enough of them
+    wall_meshes = []
+    meshes = map_meshes(_wall_worker, [outline for _, outline in wall_jobs])
+    for (name, _), mesh in zip(wall_jobs, meshes):
+        if mesh:
+            # Set wall color (light gray)
+            mesh.visual.face_colors = [200, 200, 200, 255]
+            wall_meshes.append(mesh)
+            print(f"Created {name}")
+        else:
+            print(f"Failed to create {name}")
 
     # Process doors
     door_meshes = []
-    for i, door in enumerate(contours.get("doors", [])):
+    for i, (door, bbox) in enumerate(zip(contours.get("doors", []), bboxes.get("doors", []))):
         try:
-            # Convert points to meters
-            points = [(p[0][0] * SCALE_PX_TO_M, p[0][1] * SCALE_PX_TO_M) for p in door]
-            
-            if len(points) >= 3:
-                mesh = create_door_mesh(points, DOOR_HEIGHT)
+            if len(door) >= 3:
+                # Convert bounding box to meters
+                mesh = create_door_mesh(bbox * SCALE_PX_TO_M, DOOR_HEIGHT)
                 if mesh:
                     # Set door color (brown)
                     mesh.visual.face_colors = [139, 69, 19, 255]
@@ -479,13 +461,11 @@ def main():
 
     # Process windows
     window_meshes = []
-    for i, window in enumerate(contours.get("windows", [])):
+    for i, (window, bbox) in enumerate(zip(contours.get("windows", []), bboxes.get("windows", []))):
         try:
-            # Convert points to meters
-            points = [(p[0][0] * SCALE_PX_TO_M, p[0][1] * SCALE_PX_TO_M) for p in window]
-            
-            if len(points) >= 3:
-                mesh = create_window_mesh(points, WINDOW_HEIGHT, WINDOW_BASE)
+            if len(window) >= 3:
+                # Convert bounding box to meters
+                mesh = create_window_mesh(bbox * SCALE_PX_TO_M, WINDOW_HEIGHT, WINDOW_BASE)
                 if mesh:
                     # Set window color (semi-transparent blue)
                     mesh.visual.face_colors = [100, 180, 255, 100]
@@ -508,18 +488,18 @@ def main():
     for i, room in enumerate(contours.get("rooms", [])):
         try:
             # Convert points to meters
-            points = [(p[0][0] * SCALE_PX_TO_M, p[0][1] * SCALE_PX_TO_M) for p in room]
+            points = to_meters(room)
             
             if len(points) >= 3:
-                # Create floor
-                floor_mesh = create_floor_mesh(points, FLOOR_THICKNESS, 0)
+                # Create floor and ceiling
+                floor_mesh, ceiling_mesh = create_floor_and_ceiling_meshes(
+                    points, FLOOR_THICKNESS, CEILING_THICKNESS, WALL_HEIGHT)
                 if floor_mesh:
                     # Set floor color (wood-like)
                     floor_mesh.visual.face_colors = [210, 180, 140, 255]
                     floor_meshes.append(floor_mesh)
                     
-                    # Create ceiling
-                    ceiling_mesh = create_floor_mesh(points, CEILING_THICKNESS, WALL_HEIGHT)
+                    # Add ceiling
                     if ceiling_mesh:
                         ceiling_mesh.visual.face_colors = [240, 240, 240, 255]
                         floor_meshes.append(ceiling_mesh)
@@ -539,26 +519,27 @@ def main():
     # Process rooms from wall detection
     for i, room in enumerate(detected_rooms):
         try:
-            # Convert points to meters (already in meters but need to scale)
-            points = [(p[0] * SCALE_PX_TO_M, p[1] * SCALE_PX_TO_M) for p in room.exterior.coords]
+            # Detected rooms are in pixels like the walls; convert once to meters
+            points = to_meters(room.exterior.coords)
             
             if len(points) >= 3:
-                # Create floor
-                floor_mesh = create_floor_mesh(points, FLOOR_THICKNESS, 0)
+                # Create floor and ceiling
+                floor_mesh, ceiling_mesh = create_floor_and_ceiling_meshes(
+                    points, FLOOR_THICKNESS, CEILING_THICKNESS, WALL_HEIGHT)
                 if floor_mesh:
                     # Set floor color (wood-like)
                     floor_mesh.visual.face_colors = [210, 180, 140, 255]
                     floor_meshes.append(floor_mesh)
                     
-                    # Create ceiling
-                    ceiling_mesh = create_floor_mesh(points, CEILING_THICKNESS, WALL_HEIGHT)
+                    # Add ceiling
                     if ceiling_mesh:
                         ceiling_mesh.visual.face_colors = [240, 240, 240, 255]
                         floor_meshes.append(ceiling_mesh)
                     
                     # Add furniture to room
+                    room_poly = Polygon(points)
                     room_type = room_types[i % len(room_types)]
-                    room_furniture = auto_furnish_room(room, room_type)
+                    room_furniture = auto_furnish_room(room_poly, room_type)
                     furniture_meshes.extend(room_furniture)
                     
                     print(f"Created floor and furniture for detected room {i+1} ({room_type})")
@@ -572,7 +553,7 @@ def main():
         return
 
     try:
-        scene = trimesh.util.concatenate(all_meshes)
+        scene = concatenate_meshes(all_meshes)
 
         # Export
         os.makedirs(OUT_DIR, exist_ok=True)
@@ -581,10 +562,9 @@ def main():
         glb_path = os.path.join(OUT_DIR, "furnished_home.glb")
         gltf_path = os.path.join(OUT_DIR, "furnished_home.gltf")
         
-        # Export to multiple formats
-        scene.export(obj_path)
-        scene.export(glb_path)
-        scene.export(gltf_path)
+        # Export to multiple formats concurrently
+        with ThreadPoolExecutor(max_workers=3) as ex:
+            list(ex.map(scene.export, [obj_path, glb_path, gltf_path]))
 
         print("✅ Fully furnished 3D model successfully created!")
         print(f"   - Walls: {len(wall_meshes)}")
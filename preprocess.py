@@ -1,59 +1,365 @@
 import cv2
+import functools
+from collections import Counter
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import os
+import threading
 from skimage import morphology
 
-def preprocess_image(image_path, out_edges_path="../output/edges.png"):
+# Structuring elements shared by every call
+# 5x5 rect close == two 3x3 close iterations, in half the passes
+_K5 = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+# 4-neighbour cross is enough to bridge gaps in a 1-px skeleton
+_CROSS3 = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+# Hit-or-miss pattern for a foreground pixel with no 8-neighbours
+_ISOLATED = np.array([[-1, -1, -1], [-1, 1, -1], [-1, -1, -1]], np.int8)
+
+# Background PNG encoding/writing; see wait_for_writes()
+_IO_POOL = ThreadPoolExecutor(max_workers=2)
+_PENDING_WRITES = {}  # out_edges_path -> Future
+
+def _encode_and_write(path, edges):
+    # Edge masks compress well even at the fastest zlib level
+    cv2.imwrite(path, edges, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if isinstance(edges, np.memmap):
+        edges.flush()
+    print(f"✅ Processed edges saved to: {path}")
+
+def _report_write_error(future):
+    # Surface failures even if nobody calls wait_for_writes()
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Error: Failed to save edges: {future.exception()}")
+
+def _share_edges(out_edges_path, edges):
+    """
+    Copy the edge mask out of the preprocessor's buffer. For .png outputs
+    the copy is a memory-mapped .npy next to the PNG, so downstream loaders
+    (np.load(..., mmap_mode="r")) share its pages instead of decoding the PNG.
+    The .npy is written under a temporary name and renamed into place, so
+    arrays still mapping an earlier edges.npy keep their own file.
+    """
+    if not out_edges_path.endswith(".png"):
+        return edges.copy()
+    npy_path = os.path.splitext(out_edges_path)[0] + ".npy"
+    tmp_path = f"{npy_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shared = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                           shape=edges.shape)
+        shared[:] = edges
+        os.replace(tmp_path, npy_path)
+    except BaseException:
+        # open_memmap may have failed before creating the file
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    return shared
+
+def wait_for_writes(path=None):
+    """
+    Block until the edge images queued by preprocess_image are on disk;
+    only the one for out_edges_path=path if given
+    """
+    if path is not None:
+        future = _PENDING_WRITES.pop(path, None)
+        if future is not None:
+            future.result()
+        return
+    while _PENDING_WRITES:
+        _PENDING_WRITES.popitem()[1].result()
+
+def denoise_image(gray, method="bilateral", dst=None):
+    """
+    Remove noise before thresholding.
+    "bilateral" and "median" are cheap and enough for line drawings;
+    "nlm" (fastNlMeansDenoising) is much slower, for photographed plans.
+    """
+    if method == "median":
+        return cv2.medianBlur(gray, 3, dst=dst)
+    if method == "bilateral":
+        return cv2.bilateralFilter(gray, 9, 75, 75, dst=dst)
+    if method == "nlm":
+        return cv2.fastNlMeansDenoising(gray, dst, 10, 7, 21)
+    raise ValueError(f"Unknown denoise method: {method}")
+
+def is_line_art(gray):
+    """
+    True for near-binary drawings (most pixels close to black or white),
+    which can be binarized with a global Otsu threshold instead of
+    denoise + adaptive threshold. Checks a 1/16 subsample.
+    """
+    sample = gray[::4, ::4]
+    return np.count_nonzero((sample < 50) | (sample > 200)) > 0.9 * sample.size
+
+@functools.lru_cache(maxsize=None)
+def cuda_available():
+    """True when OpenCV was built with CUDA and a device is present"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+@functools.lru_cache(maxsize=None)
+def _cuda_median_filter():
+    # Filter objects are expensive to create, so build once and reuse
+    return cv2.cuda.createMedianFilter(cv2.CV_8UC1, 3)
+
+def downscale(gray, size, dst=None, src_size=None):
+    """
+    Shrink to size=(w, h). Large ratios are halved with pyrDown first,
+    leaving INTER_AREA only the last step of at most 2x.
+    src_size=(w, h) must be given for cv2.UMat inputs, which have no shape.
+    """
+    w, h = size
+    src_w, src_h = src_size or (gray.shape[1], gray.shape[0])
+    while src_w >= 2 * w and src_h >= 2 * h:
+        gray = cv2.pyrDown(gray)
+        src_w, src_h = (src_w + 1) // 2, (src_h + 1) // 2
+    if (src_w, src_h) != (w, h):
+        gray = cv2.resize(gray, (w, h), dst=dst, interpolation=cv2.INTER_AREA)
+    return gray
+
+def _resize_denoise_cuda(gray, work_size, method, dst=None):
+    """GPU version of the resize -> denoise steps"""
+    gpu = cv2.cuda_GpuMat()
+    gpu.upload(gray)
+    w, h = work_size
+    while gpu.size()[0] >= 2 * w and gpu.size()[1] >= 2 * h:
+        gpu = cv2.cuda.pyrDown(gpu)
+    if gpu.size() != work_size:
+        gpu = cv2.cuda.resize(gpu, work_size, interpolation=cv2.INTER_AREA)
+    
+    if method == "median":
+        gpu = _cuda_median_filter().apply(gpu)
+    elif method == "bilateral":
+        gpu = cv2.cuda.bilateralFilter(gpu, 9, 75, 75)
+    elif method == "nlm":
+        gpu = cv2.cuda.fastNlMeansDenoising(gpu, 10, search_window=21, block_size=7)
+    else:
+        raise ValueError(f"Unknown denoise method: {method}")
+    return gpu.download(dst)
+
+class EdgePreprocessor:
+    """
+    Edge extraction for grayscale images of one fixed shape.
+    All intermediate buffers are allocated once in __init__ and filled via
+    OpenCV's dst= arguments, so repeated calls do not allocate.
+    The returned mask is an internal buffer, overwritten by the next call.
+    With use_umat=True the stages run on cv2.UMat (OpenCL where available).
+    line_art=True/False forces the Otsu or the denoise path; None detects
+    it per image with is_line_art().
+    """
+
+    def __init__(self, shape, denoise="bilateral", work_max_dim=600, max_dim=1200,
+                 use_umat=False, line_art=None):
+        self.denoise = denoise
+        self.use_umat = use_umat
+        self.line_art = line_art
+        
+        # Resize if very large
+        h, w = shape[:2]
+        self.scale = 1.0
+        if max(h, w) > max_dim:
+            self.scale = max_dim / float(max(h, w))
+        self.out_size = (int(w*self.scale), int(h*self.scale))
+        out_w, out_h = self.out_size
+        
+        # Work at a lower resolution; the edge mask is upsampled at the end
+        self.work_size = self.out_size
+        if work_max_dim and max(out_h, out_w) > work_max_dim:
+            work_scale = work_max_dim / float(max(out_h, out_w))
+            self.work_size = (int(out_w*work_scale), int(out_h*work_scale))
+        work_w, work_h = self.work_size
+        
+        self._gray = np.empty((work_h, work_w), np.uint8)
+        self._denoised = np.empty((work_h, work_w), np.uint8)
+        self._thresh = np.empty((work_h, work_w), np.uint8)
+        self._closed = np.empty((work_h, work_w), np.uint8)
+        self._skeleton = np.empty((work_h, work_w), np.uint8)
+        self._edges = np.empty((work_h, work_w), np.uint8)
+        self._out = (self._edges if self.work_size == self.out_size
+                     else np.empty((out_h, out_w), np.uint8))
+
+    def __call__(self, gray):
+        line_art = self.line_art
+        if line_art is None:
+            line_art = is_line_art(gray)
+        if self.use_umat:
+            return self._call_umat(gray, line_art)
+        
+        if line_art:
+            if (gray.shape[1], gray.shape[0]) != self.work_size:
+                gray = downscale(gray, self.work_size, dst=self._gray)
+            
+            # Already near-binary: a global Otsu threshold replaces denoising,
+            # then isolated speckle pixels are dropped. (A 3x3 opening would
+            # also erase the 1-px strokes of furniture and window symbols.)
+            binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU,
+                                   dst=self._thresh)[1]
+            speckle = cv2.morphologyEx(binary, cv2.MORPH_HITMISS, _ISOLATED,
+                                       dst=self._denoised)
+            thresh = cv2.subtract(binary, speckle, dst=self._thresh)
+        else:
+            thresh = self._denoise_threshold(gray)
+
+        # Morphological operations to connect lines
+        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, _K5, dst=self._closed)
+        
+        # Skeletonize to get single pixel lines, scaled to 0/255 in the buffer
+        skeleton = np.multiply(morphology.skeletonize(closed > 0), 255,
+                               out=self._skeleton, casting="unsafe")
+        
+        # Dilate to connect broken edges (the skeleton is already a 1-px edge map)
+        edges = cv2.dilate(skeleton, _CROSS3, dst=self._edges, iterations=1)
+        
+        # Bring the mask back to output resolution
+        if self._out is not self._edges:
+            edges = cv2.resize(edges, self.out_size, dst=self._out,
+                               interpolation=cv2.INTER_NEAREST)
+        return edges
+
+    def _denoise_threshold(self, gray):
+        """Resize -> denoise -> adaptive threshold, for photos and scans"""
+        if cuda_available():
+            # Resize and denoise on the GPU with a single upload
+            denoised = _resize_denoise_cuda(gray, self.work_size, self.denoise, dst=self._denoised)
+        else:
+            # Resize straight to the working size
+            if (gray.shape[1], gray.shape[0]) != self.work_size:
+                gray = downscale(gray, self.work_size, dst=self._gray)
+            
+            # Remove noise while preserving edges
+            denoised = denoise_image(gray, self.denoise, dst=self._denoised)
+        
+        # Adaptive thresholding for better line detection
+        # (box mean is a running-sum filter, cheaper than the Gaussian window)
+        return cv2.adaptiveThreshold(denoised, 255,
+                                     cv2.ADAPTIVE_THRESH_MEAN_C,
+                                     cv2.THRESH_BINARY_INV, 11, 2, dst=self._thresh)
+
+    def _call_umat(self, gray, line_art):
+        # Keep intermediates as UMat so OpenCV can dispatch to OpenCL
+        src_size = (gray.shape[1], gray.shape[0])
+        umat = downscale(cv2.UMat(gray), self.work_size, src_size=src_size)
+        
+        if line_art:
+            _, umat = cv2.threshold(umat, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+            umat = cv2.subtract(umat, cv2.morphologyEx(umat, cv2.MORPH_HITMISS, _ISOLATED))
+        else:
+            if self.denoise == "nlm":
+                # No OpenCL path worth using for NLM; run it on the CPU
+                umat = cv2.UMat(denoise_image(umat.get(), "nlm"))
+            else:
+                umat = denoise_image(umat, self.denoise)
+            umat = cv2.adaptiveThreshold(umat, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                         cv2.THRESH_BINARY_INV, 11, 2)
+        umat = cv2.morphologyEx(umat, cv2.MORPH_CLOSE, _K5)
+        
+        # skimage needs host memory for the skeleton
+        skeleton = np.multiply(morphology.skeletonize(umat.get() > 0), 255,
+                               out=self._skeleton, casting="unsafe")
+        umat = cv2.dilate(cv2.UMat(skeleton), _CROSS3, iterations=1)
+        
+        if self.work_size != self.out_size:
+            umat = cv2.resize(umat, self.out_size, interpolation=cv2.INTER_NEAREST)
+        return umat.get()
+
+# Per-thread preprocessor caches; see get_preprocessor()
+_THREAD_STATE = threading.local()
+
+def get_preprocessor(shape, denoise="bilateral", work_max_dim=600, use_umat=False,
+                     line_art=None):
+    """
+    Return an EdgePreprocessor specialized for this image shape, reused
+    across calls so sizes and buffers are only set up once per shape.
+    Each thread gets its own cache, as the preprocessor's buffers are
+    overwritten by every call.
+    """
+    cache = getattr(_THREAD_STATE, "preprocessors", None)
+    if cache is None:
+        cache = _THREAD_STATE.preprocessors = functools.lru_cache(maxsize=8)(EdgePreprocessor)
+    return cache(shape, denoise, work_max_dim, use_umat=use_umat, line_art=line_art)
+
+def preprocess_image(image_path, out_edges_path="../output/edges.png", denoise="bilateral",
+                     work_max_dim=600, use_umat=False, line_art=None):
     if not os.path.exists(image_path):
         print(f"❌ Error: File not found at {image_path}")
         return None
 
-    image = cv2.imread(image_path)
-    if image is None:
+    # Decode straight to grayscale; only edges are needed downstream
+    gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
         print("❌ Error: Failed to load image.")
         return None
 
-    # Resize if very large
-    max_dim = 1200
-    h, w = image.shape[:2]
-    scale = 1.0
-    if max(h, w) > max_dim:
-        scale = max_dim / float(max(h, w))
-        image = cv2.resize(image, (int(w*scale), int(h*scale)), interpolation=cv2.INTER_AREA)
-        print(f"Resized image by scale={scale:.3f}")
-
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # Remove noise while preserving edges
-    denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+    preprocessor = get_preprocessor(gray.shape, denoise, work_max_dim, use_umat, line_art)
+    if preprocessor.scale != 1.0:
+        print(f"Resized image by scale={preprocessor.scale:.3f}")
     
-    # Adaptive thresholding for better line detection
-    thresh = cv2.adaptiveThreshold(denoised, 255,
-                                  cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                  cv2.THRESH_BINARY_INV, 11, 2)
-
-    # Morphological operations to connect lines
-    kernel = np.ones((3, 3), np.uint8)
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+    result = preprocessor(gray)
     
-    # Skeletonize to get single pixel lines
-    skeleton = morphology.skeletonize(closed > 0)
-    skeleton = skeleton.astype(np.uint8) * 255
+    # A write still queued for this path must finish before it is replaced
+    wait_for_writes(out_edges_path)
     
-    # Find edges using Canny
-    edges = cv2.Canny(skeleton, 50, 150)
-    
-    # Dilate to connect broken edges
-    edges = cv2.dilate(edges, kernel, iterations=1)
-
+    # Copy out of the reusable buffer; the copy is shared with the writer
     os.makedirs(os.path.dirname(out_edges_path), exist_ok=True)
-    cv2.imwrite(out_edges_path, edges)
-    print(f"✅ Processed edges saved to: {out_edges_path}")
+    edges = _share_edges(out_edges_path, result)
+
+    # Encode and write in the background so the next image can start
+    future = _IO_POOL.submit(_encode_and_write, out_edges_path, edges)
+    future.add_done_callback(_report_write_error)
+    _PENDING_WRITES[out_edges_path] = future
+
+    return edges, preprocessor.scale
+
+def _init_batch_worker():
+    global _IO_POOL
+    # One OpenCV thread per process avoids oversubscribing the cores
+    cv2.setNumThreads(1)
+    # A forked child inherits the parent's writer pool without its threads,
+    # so submitted writes would never run; start a fresh pool instead
+    _IO_POOL = ThreadPoolExecutor(max_workers=2)
+    _PENDING_WRITES.clear()
+
+def _batch_worker(job):
+    image_path, out_edges_path = job
+    result = preprocess_image(image_path, out_edges_path)
+    # Pool workers exit without joining threads, so flush writes here
+    wait_for_writes()
+    return image_path, result
+
+def preprocess_batch(image_paths, out_dir="../output", workers=None):
+    """
+    Preprocess many floor plans in parallel processes.
+    Each image's edges are saved as <out_dir>/<name>_edges.png; names shared
+    by several inputs (a/plan.jpg, b/plan.png) get the first unused numeric
+    suffix, <name>_<n>_edges.png, so workers never write the same file.
+    Returns {image_path: (edges, scale) or None}.
+    """
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) // 2)
+    image_paths = list(dict.fromkeys(image_paths))  # Each input once
+    names = [os.path.splitext(os.path.basename(p))[0] for p in image_paths]
+    name_counts = Counter(names)
+    # Unique names are kept as-is, so suffixes must not collide with them
+    taken = {name for name in names if name_counts[name] == 1}
+    jobs = []
+    for image_path, name in zip(image_paths, names):
+        if name_counts[name] > 1:
+            n = 0
+            while f"{name}_{n}" in taken:
+                n += 1
+            name = f"{name}_{n}"
+            taken.add(name)
+        jobs.append((image_path, os.path.join(out_dir, f"{name}_edges.png")))
 
-    return edges, scale
+    with multiprocessing.Pool(workers, initializer=_init_batch_worker) as pool:
+        return dict(pool.imap_unordered(_batch_worker, jobs))
 
 if __name__ == "__main__":
     image_path = r"../images/floorplan2.jpg"
 
-    preprocess_image(image_path)
\ No newline at end of file
+    preprocess_image(image_path)
+    wait_for_writes()
\ No newline at end of file